@@ -7,34 +7,135 @@ Simulates the following endpoints:
   PUT  /api/v4/projects/:id              - Update project (default branch)
   POST /api/v4/projects/:id/merge_requests - Create merge request
 
+Several of these calls can be sent in one round trip with
+  POST /__batch__   [{"method": ..., "path": ..., "body": ...}, ...]
+which runs each call in order and returns
+  {"responses": [{"status": ..., "body": ...}, ...]}
+Item paths may omit the /api/v4 prefix; bodies may be JSON values or
+JSON-encoded strings. The batch itself is authenticated and recorded once.
+
+Plus control endpoints for tests (not recorded, no auth):
+  GET  /__health__     Liveness check
+  POST /__mock__/arm   {"name": "<scenario>", "count": N}
+
 Usage:
-  python3 mock_gitlab.py [--port PORT] [--state-dir DIR]
+  python3 mock_gitlab.py [--port PORT] [--state-dir DIR] [--record-headers]
 
-The server writes its port to <state-dir>/port once listening, so tests can
-discover the assigned port when using --port 0.
+Once listening, the server writes {"port": ..., "pid": ...} to
+<state-dir>/state.json, so tests can discover the assigned port when using
+--port 0. The file appears atomically with both fields filled in.
 
-Behavior can be controlled per-request via the X-Mock-Scenario header or
-globally via files in <state-dir>/:
+Failure scenarios are one-shot triggers held in memory. Arm them through
+the control endpoint (count = number of requests that should fail); files
+with a scenario's name in <state-dir>/ are also picked up once at startup:
   fail_auth        - Return 401 on next request
   fail_not_found   - Return 404 on next project lookup
   fail_server      - Return 500 on next request
 """
 
 import argparse
+import collections
+import functools
+import itertools
 import json
 import os
+import re
+import signal
+import socket
 import sys
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, unquote
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON helpers: use orjson when it is installed, otherwise fall back to the
+# stdlib. Both encoders return bytes; orjson.JSONDecodeError subclasses
+# json.JSONDecodeError, so callers only need to catch the latter.
+if orjson is not None:
+    def _dumps(obj):
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+else:
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+    _loads = json.loads
+
+
+def _encode(payload):
+    """Encode a handler payload; bytes are taken to be encoded JSON already."""
+    return payload if isinstance(payload, bytes) else _dumps(payload)
+
+
+SCENARIOS = ("fail_auth", "fail_not_found", "fail_server")
+
+API_PREFIX = "/api/v4"
+
+HTTP_VERSION = "HTTP/1.1"
+
+
+def _response_head(code, length, connection):
+    """Status line and headers for a JSON response of `length` bytes."""
+    reason = BaseHTTPRequestHandler.responses[code][0]
+    return (f"{HTTP_VERSION} {code} {reason}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {length}\r\n"
+            f"Connection: {connection}\r\n"
+            "\r\n").encode("latin-1")
+
+
+def _precompute(code, message):
+    """Encode a fixed error once: (code, body, fully framed response)."""
+    body = _dumps({"message": message})
+    return code, body, _response_head(code, len(body), "keep-alive") + body
+
+
+# Fixed error bodies, returned by route handlers (so batches can embed them)
+_INVALID_JSON_BODY = _dumps({"message": "400 Bad Request: invalid JSON"})
+_NOT_AN_OBJECT_BODY = _dumps({
+    "message": "400 Bad Request: expected a JSON object"
+})
+_PROJECT_NOT_FOUND_BODY = _dumps({"message": "404 Project Not Found"})
+
+# Fixed error responses written straight to the socket
+_RESP_401 = _precompute(401, "401 Unauthorized")
+_RESP_401_EXPIRED = _precompute(401, "401 Unauthorized - token expired")
+_RESP_500 = _precompute(500, "500 Internal Server Error")
+
+# Merge request fields copied from the create request body when present
+MR_REQUEST_FIELDS = ("description", "source_branch", "target_branch",
+                     "remove_source_branch")
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_unquote(value):
+    """unquote() memoized for the handful of project ids tests repeat."""
+    return unquote(value)
+
 
 class MockState:
     """Shared state across requests."""
 
+    # Whether recorded requests include their headers (--record-headers).
+    # Off by default, which keeps them out of the serialized entry ("headers":
+    # null); the per-request header dict itself is always built by _route.
+    RECORD_HEADERS = False
+
     def __init__(self, state_dir):
         self.state_dir = state_dir
-        self.requests = []  # List of (method, path, headers, body) tuples
+        # Recorded requests are appended to requests.jsonl as they arrive
+        # (one JSON object per line) rather than held in memory.
+        self._requests_file = open(
+            os.path.join(state_dir, "requests.jsonl"), "wb", buffering=1 << 16)
+        self._pending_requests = collections.deque()  # Encoded, not yet written
+        self._requests_lock = threading.Lock()  # Guards _requests_file
         self.project = {
             "id": 12345,
             "name": "test-project",
@@ -42,32 +143,106 @@ class MockState:
             "default_branch": "main",
             "web_url": "https://gitlab.example.com/group/test-project",
         }
-        self.merge_request_counter = 0
+        self._project_json = _dumps(self.project)
+        # Constant parts of every merge request response
+        self.mr_base = {
+            "description": "",
+            "source_branch": "",
+            "target_branch": "main",
+            "state": "opened",
+            "remove_source_branch": False,
+        }
+        self.mr_url_prefix = f"{self.project['web_url']}/-/merge_requests/"
+        # next() on a count is atomic under the GIL, so concurrent POSTs get
+        # distinct MR ids without taking a lock
+        self._mr_ids = itertools.count(1)
         self.lock = threading.Lock()
+        self.scenarios = {}  # Scenario name -> remaining firings
+        self.scenarios_lock = threading.Lock()
+        # True iff `scenarios` is non-empty; read without the lock so the
+        # common nothing-armed case costs a single attribute check.
+        self.scenarios_armed = False
+        self._load_scenario_files()
 
     def record_request(self, method, path, headers, body):
+        entry = _dumps({
+            "method": method,
+            "path": path,
+            "headers": headers if self.RECORD_HEADERS else None,
+            "body": body,
+        })
+        # deque.append is atomic, so handlers never block here. Whichever
+        # thread gets the lock writes out everything queued so far. The
+        # holder re-checks the queue after releasing, which picks up entries
+        # appended after its last drain by threads that found it locked.
+        self._pending_requests.append(entry + b"\n")
+        while (self._pending_requests and
+               self._requests_lock.acquire(blocking=False)):
+            try:
+                self._write_pending_requests()
+            finally:
+                self._requests_lock.release()
+
+    def _write_pending_requests(self):
+        """Write queued request entries to disk. Caller holds _requests_lock."""
+        pending = self._pending_requests
+        while pending:
+            self._requests_file.write(pending.popleft())
+        # Flush once per drain so readers mid-run only ever see whole lines.
+        # This is one write per drain, under _requests_lock only, so it
+        # never holds up project updates.
+        self._requests_file.flush()
+
+    def get_project_json(self):
+        """Return the project as pre-encoded JSON bytes."""
+        return self._project_json
+
+    def update_project(self, **changes):
+        """Apply changes to the project and refresh the cached JSON."""
         with self.lock:
-            self.requests.append({
-                "method": method,
-                "path": path,
-                "headers": dict(headers),
-                "body": body,
-            })
+            self.project.update(changes)
+            self._project_json = _dumps(self.project)
+            if "web_url" in changes:
+                self.mr_url_prefix = f"{self.project['web_url']}/-/merge_requests/"
+
+    def _load_scenario_files(self):
+        """Arm scenarios whose trigger files already exist in the state dir."""
+        for name in SCENARIOS:
+            path = os.path.join(self.state_dir, name)
+            if os.path.exists(path):
+                os.unlink(path)
+                self.scenarios[name] = 1
+        self.scenarios_armed = bool(self.scenarios)
+
+    def arm_scenario(self, name, count=1):
+        """Make the next `count` checks of a scenario fire (0 disarms it)."""
+        with self.scenarios_lock:
+            if count > 0:
+                self.scenarios[name] = count
+            else:
+                self.scenarios.pop(name, None)
+            self.scenarios_armed = bool(self.scenarios)
 
     def check_scenario(self, name):
-        """Check if a scenario file exists and remove it (one-shot trigger)."""
-        path = os.path.join(self.state_dir, name)
-        if os.path.exists(path):
-            os.unlink(path)
+        """Consume one firing of an armed scenario (one-shot trigger)."""
+        if not self.scenarios_armed:
+            return False
+        with self.scenarios_lock:
+            remaining = self.scenarios.get(name, 0)
+            if not remaining:
+                return False
+            if remaining > 1:
+                self.scenarios[name] = remaining - 1
+            else:
+                del self.scenarios[name]
+                self.scenarios_armed = bool(self.scenarios)
             return True
-        return False
 
     def dump_requests(self):
-        """Write all recorded requests to state dir for test inspection."""
-        path = os.path.join(self.state_dir, "requests.json")
-        with self.lock:
-            with open(path, "w") as f:
-                json.dump(self.requests, f, indent=2, default=str)
+        """Flush recorded requests to disk and close the requests file."""
+        with self._requests_lock:
+            self._write_pending_requests()
+            self._requests_file.close()
 
 
 class GitLabHandler(BaseHTTPRequestHandler):
@@ -75,123 +250,291 @@ class GitLabHandler(BaseHTTPRequestHandler):
 
     state: MockState  # Set by factory
 
+    # Keep connections open between requests so clients can reuse them.
+    # Every response carries Content-Length, which HTTP/1.1 requires for
+    # the client to find the end of the body. A kept-alive connection holds
+    # a pool worker while it waits for its next request, so that wait is
+    # capped at `idle_timeout`: with all workers parked on idle clients, a
+    # new client waits at most that long. `timeout` covers the rest of a
+    # request once its request line has arrived.
+    protocol_version = HTTP_VERSION
+    timeout = 5
+    idle_timeout = 0.25
+
+    # Small JSON responses would otherwise sit in Nagle's buffer waiting on
+    # the client's delayed ACK; StreamRequestHandler sets TCP_NODELAY.
+    disable_nagle_algorithm = True
+
+    # Responses are framed into a buffer reused across the requests on a
+    # connection; it grows on demand and is shrunk back after an outsized
+    # response so one large body doesn't stay allocated.
+    RESPONSE_BUF_SIZE = 4096
+    RESPONSE_BUF_MAX = 128 * 1024
+
+    def setup(self):
+        super().setup()
+        self._buf = bytearray(self.RESPONSE_BUF_SIZE)
+
+    def handle_one_request(self):
+        self.connection.settimeout(self.idle_timeout)
+        super().handle_one_request()
+
+    def parse_request(self):
+        # Request line received; allow the full timeout for headers and body
+        self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
     def log_message(self, format, *args):
         """Suppress default stderr logging."""
         pass
 
     def _read_body(self):
-        length = int(self.headers.get("Content-Length", 0))
-        if length > 0:
-            return self.rfile.read(length).decode("utf-8")
-        return ""
+        """Read the request body as raw bytes (JSON decoders accept bytes).
+
+        Raises ValueError if Content-Length is not a non-negative integer.
+        """
+        length = int(self._hdrs.get("content-length", 0))
+        if length < 0:
+            raise ValueError(f"negative Content-Length: {length}")
+        if length == 0:
+            return b""
+        # Fill a presized buffer from the (already buffered) rfile, looping
+        # in case the body arrives in several segments.
+        buf = bytearray(length)
+        received = 0
+        with memoryview(buf) as view:
+            while received < length:
+                n = self.rfile.readinto(view[received:])
+                if not n:
+                    break
+                received += n
+        if received < length:  # Client closed early; keep what arrived
+            del buf[received:]
+        return bytes(buf)
 
     def _send_json(self, code, data):
-        body = json.dumps(data).encode("utf-8")
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Content-Length", str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
+        self._send_json_bytes(code, _dumps(data))
+
+    def _send_json_bytes(self, code, body):
+        # Frame the status line, headers and body into one buffer so the
+        # response goes out in a single write rather than one per header.
+        connection = "close" if self.close_connection else "keep-alive"
+        head = _response_head(code, len(body), connection)
+
+        # Fill the buffer with same-length slice assignments, which copy in
+        # place instead of reallocating.
+        total = len(head) + len(body)
+        if total > len(self._buf):
+            self._buf = bytearray(total)
+        self._buf[:len(head)] = head
+        self._buf[len(head):total] = body
+        with memoryview(self._buf) as view:
+            self.wfile.write(view[:total])
+        if len(self._buf) > self.RESPONSE_BUF_MAX:
+            self._buf = bytearray(self.RESPONSE_BUF_SIZE)
+
+    def _send_precomputed(self, response):
+        code, body, framed = response
+        # The framed copy advertises keep-alive; re-frame if closing
+        if self.close_connection:
+            self._send_json_bytes(code, body)
+        else:
+            self.wfile.write(framed)
 
     def _check_auth(self):
-        token = self.headers.get("PRIVATE-TOKEN", "")
+        token = self._hdrs.get("private-token", "")
         if not token:
-            self._send_json(401, {"message": "401 Unauthorized"})
+            self._send_precomputed(_RESP_401)
             return False
         if self.state.check_scenario("fail_auth"):
-            self._send_json(401, {"message": "401 Unauthorized - token expired"})
+            self._send_precomputed(_RESP_401_EXPIRED)
             return False
         return True
 
     def _check_global_failures(self):
         if self.state.check_scenario("fail_server"):
-            self._send_json(500, {"message": "500 Internal Server Error"})
+            self._send_precomputed(_RESP_500)
             return True
         return False
 
     def _route(self, method):
-        body = self._read_body() if method in ("POST", "PUT", "PATCH") else ""
-        self.state.record_request(method, self.path, self.headers, body)
+        # Snapshot headers into a plain dict keyed by lower-cased name; each
+        # self.headers.get() is a linear, case-folding scan of the message.
+        # If a header repeats, the dict keeps the last value, whereas
+        # self.headers.get() returned the first.
+        self._hdrs = {k.lower(): v for k, v in self.headers.items()}
+        # Always consume the body, whatever the method: on a keep-alive
+        # connection unread bytes would be parsed as the next request.
+        try:
+            body = self._read_body()
+        except ValueError:
+            # The body's extent is unknown, so the connection can't be reused
+            self.close_connection = True
+            self._send_json(400, {
+                "message": "400 Bad Request: invalid Content-Length"
+            })
+            return
+
+        # Control endpoints used by the test helpers, not part of the API
+        if method == "GET" and self.path == "/__health__":
+            self._send_json(200, {"status": "ok"})
+            return
+        if method == "POST" and self.path == "/__mock__/arm":
+            self._handle_arm(body)
+            return
+
+        self.state.record_request(method, self.path, self._hdrs,
+                                  body.decode("utf-8", "replace"))
 
         if not self._check_auth():
             return
         if self._check_global_failures():
             return
 
+        if method == "POST" and self.path == "/__batch__":
+            self._handle_batch(body)
+            return
+
+        code, payload = self._dispatch(method, self.path, body)
+        self._send_json_bytes(code, _encode(payload))
+
+    def _dispatch(self, method, path, body):
+        """Run one API call; returns (status code, dict or encoded JSON)."""
+        full_path = path
+        # Route on the path alone; GitLab clients may add query parameters
+        path = urlparse(path).path
         # Strip /api/v4 prefix
-        path = self.path
-        if path.startswith("/api/v4"):
-            path = path[len("/api/v4"):]
-
-        # Route: GET /projects/:id_or_path
-        if method == "GET" and path.startswith("/projects/"):
-            self._handle_get_project(path)
-        # Route: PUT /projects/:id_or_path
-        elif method == "PUT" and path.startswith("/projects/"):
-            self._handle_update_project(path, body)
-        # Route: POST /projects/:id_or_path/merge_requests
-        elif method == "POST" and "/merge_requests" in path:
-            self._handle_create_mr(path, body)
-        else:
-            self._send_json(404, {"message": f"404 Not Found: {method} {self.path}"})
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
 
-    def _handle_get_project(self, path):
-        if self.state.check_scenario("fail_not_found"):
-            self._send_json(404, {"message": "404 Project Not Found"})
+        for pattern, handlers in self.ROUTES:
+            match = pattern.match(path)
+            if match:
+                handler = handlers.get(method)
+                if handler:
+                    return handler(self, match.group(1), body)
+                break
+
+        return 404, {"message": f"404 Not Found: {method} {full_path}"}
+
+    def _handle_batch(self, body):
+        try:
+            items = _loads(body) if body else []
+        except json.JSONDecodeError:
+            self._send_json_bytes(400, _INVALID_JSON_BODY)
+            return
+        if (not isinstance(items, list) or
+                not all(isinstance(item, dict) for item in items)):
+            self._send_json(400, {
+                "message": "400 Bad Request: expected a list of requests"
+            })
             return
 
-        # Extract project identifier (could be numeric ID or URL-encoded path)
-        parts = path.split("/")  # /projects/<identifier>
-        if len(parts) >= 3:
-            identifier = unquote(parts[2])
-        else:
-            self._send_json(404, {"message": "404 Not Found"})
+        # Splice each item's encoded body straight into the response so
+        # cached payloads (e.g. the project JSON) aren't decoded again.
+        responses = []
+        for item in items:
+            item_body = item.get("body")
+            if item_body is None:
+                item_body = b""
+            elif isinstance(item_body, str):
+                item_body = item_body.encode("utf-8")
+            else:
+                item_body = _dumps(item_body)
+            code, payload = self._dispatch(
+                str(item.get("method", "GET")).upper(),
+                str(item.get("path", "")),
+                item_body)
+            responses.append(b'{"status":%d,"body":%s}' % (code, _encode(payload)))
+
+        self._send_json_bytes(
+            200, b'{"responses":[' + b",".join(responses) + b"]}")
+
+    def _handle_arm(self, body):
+        try:
+            data = _loads(body) if body else {}
+        except json.JSONDecodeError:
+            self._send_json_bytes(400, _INVALID_JSON_BODY)
+            return
+
+        if not isinstance(data, dict):
+            self._send_json_bytes(400, _NOT_AN_OBJECT_BODY)
+            return
+
+        name = data.get("name")
+        count = data.get("count", 1)
+        if name not in SCENARIOS:
+            self._send_json(400, {
+                "message": f"400 Bad Request: unknown scenario {name!r}"
+            })
+            return
+        if not isinstance(count, int) or isinstance(count, bool):
+            self._send_json(400, {
+                "message": f"400 Bad Request: count must be an integer, got {count!r}"
+            })
             return
 
+        self.state.arm_scenario(name, count)
+        self._send_json(200, {"name": name, "count": count})
+
+    def _handle_get_project(self, project_id, body):
+        if self.state.check_scenario("fail_not_found"):
+            return 404, _PROJECT_NOT_FOUND_BODY
+
+        # Project identifier could be numeric ID or URL-encoded path
+        identifier = _cached_unquote(project_id)
+
         # Match by ID or path
         project = self.state.project
         if (str(project["id"]) == identifier or
                 project["path_with_namespace"] == identifier):
-            self._send_json(200, project)
-        else:
-            self._send_json(404, {
-                "message": f"404 Project Not Found: {identifier}"
-            })
+            return 200, self.state.get_project_json()
+        return 404, {"message": f"404 Project Not Found: {identifier}"}
 
-    def _handle_update_project(self, path, body):
+    def _handle_update_project(self, project_id, body):
         try:
-            data = json.loads(body) if body else {}
+            data = _loads(body) if body else {}
         except json.JSONDecodeError:
-            self._send_json(400, {"message": "400 Bad Request: invalid JSON"})
-            return
+            return 400, _INVALID_JSON_BODY
+        if not isinstance(data, dict):
+            return 400, _NOT_AN_OBJECT_BODY
 
         if "default_branch" in data:
-            self.state.project["default_branch"] = data["default_branch"]
+            self.state.update_project(default_branch=data["default_branch"])
 
-        self._send_json(200, self.state.project)
+        return 200, self.state.get_project_json()
 
-    def _handle_create_mr(self, path, body):
+    def _handle_create_mr(self, project_id, body):
         try:
-            data = json.loads(body) if body else {}
+            data = _loads(body) if body else {}
         except json.JSONDecodeError:
-            self._send_json(400, {"message": "400 Bad Request: invalid JSON"})
-            return
-
-        self.state.merge_request_counter += 1
-        mr_id = self.state.merge_request_counter
-
-        mr = {
-            "id": mr_id,
-            "iid": mr_id,
-            "title": data.get("title", f"MR !{mr_id}"),
-            "description": data.get("description", ""),
-            "source_branch": data.get("source_branch", ""),
-            "target_branch": data.get("target_branch", "main"),
-            "state": "opened",
-            "web_url": f"{self.state.project['web_url']}/-/merge_requests/{mr_id}",
-            "remove_source_branch": data.get("remove_source_branch", False),
-        }
-        self._send_json(201, mr)
+            return 400, _INVALID_JSON_BODY
+        if not isinstance(data, dict):
+            return 400, _NOT_AN_OBJECT_BODY
+
+        mr_id = next(self.state._mr_ids)
+
+        mr = self.state.mr_base.copy()
+        for key in MR_REQUEST_FIELDS:
+            if key in data:
+                mr[key] = data[key]
+        mr["id"] = mr["iid"] = mr_id
+        mr["title"] = data["title"] if "title" in data else f"MR !{mr_id}"
+        mr["web_url"] = self.state.mr_url_prefix + str(mr_id)
+        return 201, mr
+
+    # Route table: URL pattern (after the API prefix) -> {method: handler}.
+    # Each pattern captures the :id_or_path segment passed to the handler,
+    # which returns (status code, payload) for _dispatch.
+    ROUTES = [
+        (re.compile(r"^/projects/([^/]+)$"), {
+            "GET": _handle_get_project,
+            "PUT": _handle_update_project,
+        }),
+        (re.compile(r"^/projects/([^/]+)/merge_requests$"), {
+            "POST": _handle_create_mr,
+        }),
+    ]
 
     def do_GET(self):
         self._route("GET")
@@ -203,6 +546,44 @@ class GitLabHandler(BaseHTTPRequestHandler):
         self._route("PUT")
 
 
+class BoundedThreadingHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that serves connections from a fixed-size pool."""
+
+    max_workers = 16
+
+    def __init__(self, *args, **kwargs):
+        # Set up before super().__init__, which calls server_close() if
+        # binding the port fails
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._connections = set()  # Sockets currently owned by a worker
+        self._connections_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def shutdown_request(self, request):
+        with self._connections_lock:
+            self._connections.discard(request)
+        super().shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Pool workers are not daemon threads, so interpreter exit waits for
+        # them. Shut down live connections so workers parked on an idle
+        # keep-alive socket see EOF and return instead of waiting out
+        # GitLabHandler.timeout.
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
 def make_handler(state):
     """Create a handler class bound to the given state."""
 
@@ -218,36 +599,47 @@ def main():
     parser.add_argument("--port", type=int, default=0, help="Port (0 = auto)")
     parser.add_argument("--state-dir", default="/tmp/mock_gitlab",
                         help="Directory for state files")
+    parser.add_argument("--record-headers", action="store_true",
+                        help="Include request headers in requests.jsonl")
     args = parser.parse_args()
 
     os.makedirs(args.state_dir, exist_ok=True)
 
+    MockState.RECORD_HEADERS = args.record_headers
     state = MockState(args.state_dir)
     handler = make_handler(state)
-    server = HTTPServer(("127.0.0.1", args.port), handler)
+    # Serve connections from a worker pool so concurrent requests from a
+    # test don't queue behind each other.
+    server = BoundedThreadingHTTPServer(("127.0.0.1", args.port), handler)
 
     actual_port = server.server_address[1]
 
-    # Write port file so tests can discover it
-    port_file = os.path.join(args.state_dir, "port")
-    with open(port_file, "w") as f:
-        f.write(str(actual_port))
-
-    # Write PID file for cleanup
-    pid_file = os.path.join(args.state_dir, "pid")
-    with open(pid_file, "w") as f:
-        f.write(str(os.getpid()))
+    # Publish port and PID in one write, renamed into place so tests never
+    # see a partially written state file
+    state_file = os.path.join(args.state_dir, "state.json")
+    tmp_file = state_file + ".tmp"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, _dumps({"port": actual_port, "pid": os.getpid()}))
+    finally:
+        os.close(fd)
+    os.replace(tmp_file, state_file)
 
     print(f"Mock GitLab API listening on http://127.0.0.1:{actual_port}", flush=True)
     print(f"State dir: {args.state_dir}", flush=True)
 
+    # Let `kill` shut down cleanly so recorded requests get flushed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         pass
     finally:
-        state.dump_requests()
+        # Stop the server and its workers first so no handler can record a
+        # request after the requests file is closed
         server.server_close()
+        state.dump_requests()
 
 
 if __name__ == "__main__":
@@ -28,6 +28,12 @@ teardown() {
   echo "$output" | jq -e '.id == 12345'
 }
 
+@test "gitlab_api: GET with query string returns project" {
+  run gitlab_api GET "/projects/12345?statistics=true"
+  [ "$status" -eq 0 ]
+  echo "$output" | jq -e '.id == 12345'
+}
+
 @test "gitlab_api: PUT updates project" {
   run gitlab_api PUT "/projects/12345" '{"default_branch":"release/v1.0.0"}'
   [ "$status" -eq 0 ]
@@ -65,6 +71,22 @@ teardown() {
   [[ "$output" == *"401"* ]]
 }
 
+@test "gitlab_api: mock scenario armed with a count fails that many requests" {
+  mock_trigger_scenario "fail_auth" 2
+
+  run gitlab_api GET "/projects/12345"
+  [ "$status" -ne 0 ]
+  [[ "$output" == *"401"* ]]
+
+  run gitlab_api GET "/projects/12345"
+  [ "$status" -ne 0 ]
+  [[ "$output" == *"401"* ]]
+
+  run gitlab_api GET "/projects/12345"
+  [ "$status" -eq 0 ]
+  echo "$output" | jq -e '.id == 12345'
+}
+
 # ─── gitlab_api: server errors ───────────────────────────────────────────────────
 
 @test "gitlab_api: handles 500 server error" {
@@ -83,6 +105,31 @@ teardown() {
   [[ "$output" == *"404"* ]]
 }
 
+# ─── mock GitLab: batch endpoint ─────────────────────────────────────────────────
+
+@test "mock batch: runs mixed requests and reports per-item failures" {
+  local body
+  body=$(jq -n '[
+    {method: "GET", path: "/projects/12345"},
+    {method: "PUT", path: "/projects/12345", body: {default_branch: "release/v1.0.0"}},
+    {method: "POST", path: "/api/v4/projects/12345/merge_requests",
+     body: {source_branch: "release/v1.0.0", title: "Release v1.0.0"}},
+    {method: "PUT", path: "/projects/12345", body: 5}
+  ]')
+
+  run curl --silent --fail \
+    --header "PRIVATE-TOKEN: $GITLAB_TOKEN" \
+    --request POST --data "$body" \
+    "http://127.0.0.1:${MOCK_PORT}/__batch__"
+  [ "$status" -eq 0 ]
+  echo "$output" | jq -e '.responses | length == 4'
+  echo "$output" | jq -e '.responses[0] | .status == 200 and .body.id == 12345'
+  echo "$output" | jq -e '.responses[1] | .status == 200 and .body.default_branch == "release/v1.0.0"'
+  echo "$output" | jq -e '.responses[2] | .status == 201 and .body.iid == 1'
+  echo "$output" | jq -e '.responses[3].status == 400'
+  echo "$output" | jq -e '.responses[3].body.message | contains("expected a JSON object")'
+}
+
 # ─── SEC-1: token not exposed in process args ────────────────────────────────────
 
 @test "gitlab_api: token is passed via file not command-line arg" {
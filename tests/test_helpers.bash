@@ -143,19 +143,19 @@ start_mock_gitlab() {
     --state-dir "$MOCK_STATE_DIR" &
   MOCK_PID=$!
 
-  # Wait for the port file to appear (up to 5 seconds)
+  # Wait for the state file to appear (up to 5 seconds)
   local retries=50
-  while [[ ! -f "$MOCK_STATE_DIR/port" && $retries -gt 0 ]]; do
+  while [[ ! -f "$MOCK_STATE_DIR/state.json" && $retries -gt 0 ]]; do
     sleep 0.1
     retries=$((retries - 1))
   done
 
-  if [[ ! -f "$MOCK_STATE_DIR/port" ]]; then
+  if [[ ! -f "$MOCK_STATE_DIR/state.json" ]]; then
     echo "ERROR: Mock GitLab server failed to start" >&2
     return 1
   fi
 
-  MOCK_PORT="$(cat "$MOCK_STATE_DIR/port")"
+  MOCK_PORT="$(jq -r '.port' "$MOCK_STATE_DIR/state.json")"
 }
 
 stop_mock_gitlab() {
@@ -169,17 +169,23 @@ stop_mock_gitlab() {
   fi
 }
 
-# Trigger a mock failure scenario for the next request
+# Trigger a mock failure scenario for the next request (or the next COUNT)
 mock_trigger_scenario() {
   local scenario="$1"
-  touch "$MOCK_STATE_DIR/$scenario"
+  local count="${2:-1}"
+  curl --silent --show-error --fail \
+    --request POST \
+    --data "{\"name\":\"$scenario\",\"count\":$count}" \
+    "http://127.0.0.1:${MOCK_PORT}/__mock__/arm" >/dev/null
 }
 
-# Read recorded requests from the mock
+# Read recorded requests from the mock as a JSON array. The server writes and
+# flushes each request to requests.jsonl before responding to it (a request
+# racing a concurrent one may land just after), so this can be called
+# mid-test, before stop_mock_gitlab removes the state dir.
 mock_get_requests() {
-  # Ask the server to dump first (it dumps on shutdown, but we may want mid-test)
-  if [[ -f "$MOCK_STATE_DIR/requests.json" ]]; then
-    cat "$MOCK_STATE_DIR/requests.json"
+  if [[ -f "$MOCK_STATE_DIR/requests.jsonl" ]]; then
+    jq -s . "$MOCK_STATE_DIR/requests.jsonl"
   else
     echo "[]"
   fi